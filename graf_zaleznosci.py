@@ -0,0 +1,142 @@
+"""
+Author: Dominik Dąbek
+"""
+
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Set
+from skala_podatkowa import TaxPeriod, round_whole
+
+
+class _Node:
+    def __init__(self, name: 'str', compute: 'Callable[..., Any]' = None, dependencies: 'List[str]' = None):
+        self.name = name
+        self.compute = compute
+        self.dependencies = dependencies or []
+        self.value = None
+        self.dependents = []  # type: List[str]
+        self.watchers = []  # type: List[Callable[[Any], None]]
+
+
+class DependencyGraph:
+    """Recomputes only the derived values whose dependencies changed
+    and notifies watchers only when a value actually changed.
+    A derived value is computed only from the values of its dependencies, passed in their order.
+    Nodes must be added after their dependencies, so insertion order is a topological order."""
+
+    def __init__(self):
+        self._nodes = {}  # type: Dict[str, _Node]
+        self._dirty = set()  # type: Set[str]
+
+    def add_input(self, name: 'str', value: 'Any', on_set: 'Callable[[Any], None]' = None):
+        self._nodes[name] = _Node(name)
+        self._nodes[name].value = value
+        if on_set:
+            self.watch(name, on_set)
+
+    def add_derived(self, name: 'str', compute: 'Callable[..., Any]', dependencies: 'List[str]'):
+        for dependency in dependencies:
+            if dependency not in self._nodes:
+                raise KeyError('Brak wartości {} potrzebnej do wyliczenia {}'.format(dependency, name))
+        self._nodes[name] = _Node(name, compute, dependencies)
+        for dependency in dependencies:
+            self._nodes[dependency].dependents.append(name)
+        self._dirty.add(name)
+
+    def watch(self, name: 'str', callback: 'Callable[[Any], None]'):
+        self._nodes[name].watchers.append(callback)
+
+    def value(self, name: 'str') -> 'Any':
+        return self._nodes[name].value
+
+    def set_input(self, name: 'str', value: 'Any'):
+        node = self._nodes[name]
+        if node.value == value:
+            return
+        node.value = value
+        self._changed(node)
+
+    def update(self):
+        for node in self._nodes.values():
+            if node.name not in self._dirty:
+                continue
+            self._dirty.discard(node.name)
+            new_value = node.compute(*[self._nodes[dependency].value for dependency in node.dependencies])
+            if node.value == new_value and node.value is not None:
+                continue
+            node.value = new_value
+            self._changed(node)
+
+    def _changed(self, node: '_Node'):
+        self._dirty.update(node.dependents)
+        for watcher in node.watchers:
+            watcher(node.value)
+
+
+TAX_PERIOD_INPUTS = {
+    'revenue': TaxPeriod.set_revenue,
+    'expenses': TaxPeriod.set_expenses,
+    'tax_reduction': TaxPeriod.set_tax_reduction,
+    'income_reduction': TaxPeriod.set_income_reduction,
+    'tax_prepayment': TaxPeriod.set_tax_prepayment
+}
+
+# w kolejności wyliczania
+TAX_PERIOD_DEPENDENCIES = {
+    'income': ['revenue', 'expenses'],
+    'tax_basis': ['income', 'income_reduction'],
+    'tax_basis_rounded': ['tax_basis'],
+    'tax': ['tax_basis_rounded'],
+    'tax_free_amount': ['tax_basis_rounded'],
+    'tax_free_amount_end_of_year': ['tax_basis_rounded'],
+    'tax_owed': ['tax', 'tax_reduction', 'tax_free_amount', 'tax_prepayment'],
+    'tax_owed_end_of_year': ['tax', 'tax_reduction', 'tax_free_amount_end_of_year', 'tax_prepayment']
+}
+
+
+def calculate_income(revenue: 'Decimal', expenses: 'Decimal') -> 'Decimal':
+    return revenue - expenses
+
+
+def calculate_tax_basis(income: 'Decimal', income_reduction: 'Decimal') -> 'Decimal':
+    return Decimal(income - income_reduction)
+
+
+def calculate_tax_owed(tax: 'Decimal', tax_reduction: 'Decimal', tax_free_amount: 'Decimal',
+                       tax_prepayment: 'Decimal') -> 'Decimal':
+    tax_owed = tax - tax_reduction - tax_free_amount - tax_prepayment
+    if 0 > tax_owed:
+        tax_owed = Decimal('0')
+    return tax_owed
+
+
+def from_rounded_basis(tax_period_class: 'type', method: 'str') -> 'Callable[[Decimal], Decimal]':
+    """Calculates a TaxPeriod method that depends only on the rounded tax basis,
+    on a separate TaxPeriod whose revenue is that basis."""
+    basis_period = tax_period_class()
+    calculate = getattr(basis_period, method)
+
+    def compute(tax_basis_rounded: 'Decimal') -> 'Decimal':
+        basis_period.set_revenue(tax_basis_rounded)
+        return calculate()
+    return compute
+
+
+def tax_period_graph(tax_period: 'TaxPeriod') -> 'DependencyGraph':
+    """Builds a graph of TaxPeriod inputs and quantities, named after TaxPeriod attributes and methods."""
+    computes = {
+        'income': calculate_income,
+        'tax_basis': calculate_tax_basis,
+        'tax_basis_rounded': round_whole,
+        'tax': from_rounded_basis(type(tax_period), 'tax'),
+        'tax_free_amount': from_rounded_basis(type(tax_period), 'tax_free_amount'),
+        'tax_free_amount_end_of_year': from_rounded_basis(type(tax_period), 'tax_free_amount_end_of_year'),
+        'tax_owed': calculate_tax_owed,
+        'tax_owed_end_of_year': calculate_tax_owed
+    }
+    graph = DependencyGraph()
+    for input_name, setter in TAX_PERIOD_INPUTS.items():
+        graph.add_input(input_name, getattr(tax_period, input_name),
+                        lambda value, setter=setter: setter(tax_period, value))
+    for quantity, dependencies in TAX_PERIOD_DEPENDENCIES.items():
+        graph.add_derived(quantity, computes[quantity], dependencies)
+    return graph
@@ -0,0 +1,230 @@
+"""
+Author: Dominik Dąbek
+"""
+
+import csv
+import datetime
+import decimal as dec
+import functools
+import re
+import sys
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+from parsowanie import convert_input
+from skala_podatkowa import TaxPeriod
+
+DATE_FORMATS = ['%Y-%m-%d', '%d.%m.%Y', '%d-%m-%Y', '%Y.%m.%d', '%d/%m/%Y']
+
+BANK_DATE_COLUMN = 'Data operacji'
+BANK_AMOUNT_COLUMN = 'Kwota'
+BANK_DESCRIPTION_COLUMN = 'Opis operacji'
+BANK_DELIMITER = ';'
+
+# numery kolumn KPiR liczone od 1, jak w rozporządzeniu
+KPIR_DATE_COLUMN = 2
+KPIR_REVENUE_COLUMNS = [9]  # razem przychód
+KPIR_EXPENSES_COLUMNS = [10, 11, 14]  # zakup towarów, koszty uboczne zakupu, razem wydatki
+KPIR_DELIMITER = ';'
+
+ENCODING = 'utf-8-sig'
+
+MINUS_SIGNS = '-−'
+# przelewy do ZUS i zaliczki PIT nie są kosztem, kalkulator liczy je osobno; wpływy zawsze są przychodem
+ZUS_PATTERN = re.compile(r'\bZUS\b', re.IGNORECASE)
+TAX_PREPAYMENT_PATTERN = re.compile(r'\bPIT\b|\bPIT-?\d', re.IGNORECASE)
+
+
+class Transaction(NamedTuple):
+    date: 'datetime.date'
+    revenue: 'dec.Decimal'
+    expenses: 'dec.Decimal'
+    tax_prepayment: 'dec.Decimal' = dec.Decimal('0')
+    zus: 'dec.Decimal' = dec.Decimal('0')
+
+
+class MonthlyTotals(NamedTuple):
+    revenue: 'dec.Decimal'
+    expenses: 'dec.Decimal'
+    tax_prepayment: 'dec.Decimal'
+    zus: 'dec.Decimal'
+
+
+def parse_amount(amount_str: 'str') -> 'dec.Decimal':
+    """Accepts a minus anywhere ('-5 zł', 'PLN -100,00', '100,00-') and accounting brackets ('(100,00)').
+    Raises ValueError when there is no amount to read; an empty cell is 0."""
+    amount_str = amount_str.strip()
+    if not amount_str:
+        return dec.Decimal('0')
+    try:
+        amount = dec.Decimal(amount_str.replace(',', '.'))
+        if amount.is_finite():
+            return amount
+    except dec.InvalidOperation:
+        pass
+    negative = amount_str.startswith('(') and amount_str.endswith(')')
+    for minus_sign in MINUS_SIGNS:
+        if minus_sign in amount_str:
+            negative = True
+    number = re.sub(r'[^\d.,\s]', '', amount_str).strip()
+    if not re.search(r'\d', number):
+        raise ValueError('Nieprawidłowa kwota: ' + amount_str)
+    try:
+        amount = convert_input(number)
+    except (AttributeError, dec.InvalidOperation):
+        raise ValueError('Nieprawidłowa kwota: ' + amount_str)
+    if negative:
+        amount = -amount
+    return amount
+
+
+# wyciągi powtarzają te same daty, a strptime jest najwolniejszym krokiem importu
+@functools.lru_cache(maxsize=4096)
+def parse_date(date_str: 'str') -> 'datetime.date':
+    date_str = date_str.strip()[:10]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(date_str, date_format).date()
+        except ValueError:
+            pass
+    raise ValueError('Nieznany format daty: ' + date_str)
+
+
+def classify_amount(date: 'datetime.date', amount: 'dec.Decimal', description: 'str' = '') -> 'Transaction':
+    """Negative amounts (outflows) described as ZUS go to zus, described as PIT go to tax_prepayment
+    and other outflows are expenses. Positive amounts (inflows) are revenue, whatever their description,
+    e.g. an invoice paid with 'PIT-37' in the title or a sickness benefit from ZUS."""
+    zero = dec.Decimal('0')
+    if amount >= 0:
+        return Transaction(date, amount, zero)
+    if ZUS_PATTERN.search(description):
+        return Transaction(date, zero, zero, zero, -amount)
+    if TAX_PREPAYMENT_PATTERN.search(description):
+        return Transaction(date, zero, zero, -amount, zero)
+    return Transaction(date, zero, -amount)
+
+
+def _amount_error(file_name: 'str', line_number: 'int', error: 'Exception') -> 'ValueError':
+    return ValueError('{}, wiersz {}: {}'.format(file_name, line_number, error))
+
+
+def read_bank_csv(file_name: 'str', date_column: 'str' = BANK_DATE_COLUMN,
+                  amount_column: 'str' = BANK_AMOUNT_COLUMN,
+                  description_column: 'str' = BANK_DESCRIPTION_COLUMN,
+                  delimiter: 'str' = BANK_DELIMITER) -> 'Iterator[Transaction]':
+    """Streams transactions from a bank statement CSV export.
+    Lines before the header row (account details etc.) and rows without a valid date are skipped,
+    a row with a date but without a valid amount raises ValueError with its line number."""
+    with open(file_name, 'r', encoding=ENCODING, newline='') as file:
+        rows = csv.reader(file, delimiter=delimiter)
+        date_index = amount_index = description_index = None
+        for row in rows:
+            cells = [cell.strip().lstrip('#') for cell in row]
+            if date_column in cells and amount_column in cells:
+                date_index = cells.index(date_column)
+                amount_index = cells.index(amount_column)
+                if description_column in cells:
+                    description_index = cells.index(description_column)
+                break
+        if date_index is None:
+            raise ValueError('Brak nagłówka z kolumnami: ' + date_column + ', ' + amount_column)
+        for row in rows:
+            try:
+                date = parse_date(row[date_index])
+            except (IndexError, ValueError):
+                continue
+            try:
+                amount = parse_amount(row[amount_index])
+            except (IndexError, ValueError) as error:
+                raise _amount_error(file_name, rows.line_num, error)
+            description = ''
+            if description_index is not None and description_index < len(row):
+                description = row[description_index]
+            yield classify_amount(date, amount, description)
+
+
+def read_kpir_csv(file_name: 'str', date_column: 'int' = KPIR_DATE_COLUMN,
+                  revenue_columns: 'List[int]' = None, expenses_columns: 'List[int]' = None,
+                  delimiter: 'str' = KPIR_DELIMITER) -> 'Iterator[Transaction]':
+    """Streams entries from a KPiR (podatkowa księga przychodów i rozchodów) saved as CSV.
+    Rows without a valid date, like headers and page summaries, are skipped,
+    a row with a date but without valid amounts raises ValueError with its line number."""
+    if revenue_columns is None:
+        revenue_columns = KPIR_REVENUE_COLUMNS
+    if expenses_columns is None:
+        expenses_columns = KPIR_EXPENSES_COLUMNS
+    with open(file_name, 'r', encoding=ENCODING, newline='') as file:
+        rows = csv.reader(file, delimiter=delimiter)
+        for row in rows:
+            try:
+                date = parse_date(row[date_column - 1])
+            except (IndexError, ValueError):
+                continue
+            try:
+                revenue = sum((parse_amount(row[column - 1]) for column in revenue_columns), dec.Decimal('0'))
+                expenses = sum((parse_amount(row[column - 1]) for column in expenses_columns), dec.Decimal('0'))
+            except (IndexError, ValueError) as error:
+                raise _amount_error(file_name, rows.line_num, error)
+            yield Transaction(date, revenue, expenses)
+
+
+def aggregate_monthly(transactions: 'Iterable[Transaction]') -> 'Dict[Tuple[int,int],MonthlyTotals]':
+    """Sums transactions per (year, month), in chronological order."""
+    sums = {}
+    for transaction in transactions:
+        month_sums = sums.setdefault((transaction.date.year, transaction.date.month),
+                                     [dec.Decimal('0')] * len(MonthlyTotals._fields))
+        month_sums[0] += transaction.revenue
+        month_sums[1] += transaction.expenses
+        month_sums[2] += transaction.tax_prepayment
+        month_sums[3] += transaction.zus
+    monthly_totals = OrderedDict()
+    for month in sorted(sums):
+        monthly_totals[month] = MonthlyTotals(*sums[month])
+    return monthly_totals
+
+
+def cumulative_tax_periods(
+        monthly_totals: 'Dict[Tuple[int,int],MonthlyTotals]') -> 'Dict[Tuple[int,int],TaxPeriod]':
+    """Prepayments are calculated from the beginning of the year,
+    so each month gets a TaxPeriod with revenue, expenses and paid prepayments summed since January.
+    A prepayment paid in January for the previous year has to be taken out by hand.
+    ZUS is not set: one transfer mixes social contributions (odliczenia od dochodu)
+    and health insurance (odliczenia od podatku), which have to be split by hand."""
+    tax_periods = OrderedDict()
+    year = None
+    revenue = expenses = tax_prepayment = dec.Decimal('0')
+    for month in sorted(monthly_totals):
+        if month[0] != year:
+            year = month[0]
+            revenue = expenses = tax_prepayment = dec.Decimal('0')
+        revenue += monthly_totals[month].revenue
+        expenses += monthly_totals[month].expenses
+        tax_prepayment += monthly_totals[month].tax_prepayment
+        tax_period = TaxPeriod()
+        tax_period.set_revenue(revenue)
+        tax_period.set_expenses(expenses)
+        tax_period.set_tax_prepayment(tax_prepayment)
+        tax_periods[month] = tax_period
+    return tax_periods
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in ('bank', 'kpir'):
+        print('Użycie: python import_danych.py bank|kpir plik.csv')
+        sys.exit(1)
+    if sys.argv[1] == 'bank':
+        transactions = read_bank_csv(sys.argv[2])
+    else:
+        transactions = read_kpir_csv(sys.argv[2])
+    monthly_totals = aggregate_monthly(transactions)
+    tax_periods = cumulative_tax_periods(monthly_totals)
+    for (year, month), totals in monthly_totals.items():
+        tax_period = tax_periods[(year, month)]
+        print('{}-{:02d}\tprzychód {}\tkoszty {}\tzaliczki PIT {}\tZUS {}'
+              '\tprzychód od początku roku {}\tkoszty od początku roku {}\tzaliczki od początku roku {}'.format(
+                  year, month, totals.revenue, totals.expenses, totals.tax_prepayment, totals.zus,
+                  tax_period.revenue, tax_period.expenses, tax_period.tax_prepayment))
+
+
+if __name__ == '__main__':
+    main()
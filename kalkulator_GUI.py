@@ -2,15 +2,20 @@
 Author: Dominik Dąbek
 """
 import json
-import re
 import tkinter as tk
 from tkinter import ttk
 from tkinter import font as tk_font
+from tkinter import messagebox
 import decimal as dec
-from typing import Dict, List, Callable
-from skala_podatkowa import TaxPeriod
+from typing import Dict, List, Callable, Tuple
+from parsowanie import convert_input
+from skala_podatkowa import TaxPeriod, TracedTaxPeriod
+from graf_zaleznosci import DependencyGraph, tax_period_graph
+from scenariusze import Scenarios
 
 SAVE_FILENAME = 'podatek_dane.txt'
+TRACE_FILENAME = 'podatek_wyliczenia.json'
+SCENARIOS_KEY = 'scenarios'
 
 
 class FormField:
@@ -78,53 +83,33 @@ class GUIOptions:
         return self._tab_font
 
 
-def strip_non_numeric(input_str: 'str') -> 'str':
-    return re.match(r'^\D*(\d.*\d)\D*$', input_str).group(1)
-
-
-def only_numeric(input_str: 'str') -> 'str':
-    return re.sub(r'\D', '', input_str)
-
-
-def clean_input(input_str: 'str') -> 'str':
-    cleaned_input = strip_non_numeric(input_str)
-    separator_index = None
-    try:
-        if not cleaned_input[-2].isnumeric():
-            separator_index = -2
-        elif not cleaned_input[-3].isnumeric():
-            separator_index = -3
-    except IndexError:
-        pass
-    if separator_index:
-        whole_part = only_numeric(cleaned_input[:separator_index])
-        fraction_part = only_numeric(cleaned_input[separator_index + 1:])
-        cleaned_input = whole_part + '.' + fraction_part
-    else:
-        cleaned_input = only_numeric(cleaned_input)
-    return cleaned_input
-
-
-def convert_input(input_value: 'str') -> 'dec.Decimal':
-    try:
-        decimal = dec.Decimal(input_value.replace(',', '.'))
-    except (AttributeError, dec.InvalidOperation):
-        cleaned_input = clean_input(input_value)
-        decimal = dec.Decimal(cleaned_input)
-    return decimal
-
-
-def save_inputs(inputs_dict):
+def save_inputs(inputs_dict, scenarios_dict=None):
     # TODO error handling
+    saved_dict = dict(inputs_dict)
+    if scenarios_dict:
+        saved_dict[SCENARIOS_KEY] = scenarios_dict
     with open(SAVE_FILENAME, 'w') as file:
-        json.dump(inputs_dict, file)
+        json.dump(saved_dict, file)
 
 
 def load_inputs() -> 'Dict[str,str]':
-    # TODO error handling
+    """Raises OSError when the file can't be read and ValueError when it isn't a saved form."""
+    inputs_dict, _ = load_inputs_and_scenarios()
+    return inputs_dict
+
+
+def load_inputs_and_scenarios() -> 'Tuple[Dict[str,str],Dict[str,Dict[str,str]]]':
     with open(SAVE_FILENAME, 'r') as file:
         inputs_dict = json.load(file)
-    return inputs_dict
+    if not isinstance(inputs_dict, dict):
+        raise ValueError('Nieprawidłowy plik ' + SAVE_FILENAME)
+    scenarios_dict = inputs_dict.pop(SCENARIOS_KEY, {})
+    return inputs_dict, scenarios_dict
+
+
+def save_trace(trace_json: 'str'):
+    with open(TRACE_FILENAME, 'w') as file:
+        file.write(trace_json)
 
 
 class KalkulatorGUI:
@@ -149,18 +134,63 @@ class KalkulatorGUI:
         'income',
         'tax_basis',
         'tax',
-        'tax_owed'
+        'tax_free_amount',
+        'tax_owed',
+        'tax_owed_end_of_year'
     ]
 
     OUTPUT_LABELS = [
         'Dochód',
         'Podstawa obliczenia podatku',
         'Podatek według skali',
-        'Zaliczka do zapłaty'
+        'Kwota zmniejszająca podatek',
+        'Zaliczka do zapłaty',
+        'Podatek do zapłaty na koniec roku'
     ]
 
     OUTPUTS_HEADER = 'Wyliczenia'
 
+    TRACE_LABELS = {
+        'revenue': 'Przychód',
+        'expenses': 'Koszty',
+        'income': 'Dochód',
+        'income_reduction': 'Odliczenia od dochodu',
+        'tax_basis': 'Podstawa obliczenia podatku',
+        'tax_basis_rounded': 'Podstawa po zaokrągleniu',
+        'tax_bracket': 'Próg podatkowy',
+        'tax': 'Podatek według skali',
+        'tax_reduction': 'Odliczenia od podatku',
+        'tax_free_amount_bracket': 'Kwota zmniejszająca',
+        'tax_free_amount': 'Kwota zmniejszająca podatek',
+        'tax_prepayment': 'Zapłacone zaliczki',
+        'tax_owed_branch': 'Wynik',
+        'tax_owed': 'Zaliczka do zapłaty'
+    }
+
+    TRACE_BRANCH_LABELS = {
+        TracedTaxPeriod.TAX_BELOW_THRESHOLD: 'do progu (17%)',
+        TracedTaxPeriod.TAX_ABOVE_THRESHOLD: 'powyżej progu (32%)',
+        TracedTaxPeriod.TAX_FREE_AMOUNT_GRANTED: 'przysługuje',
+        TracedTaxPeriod.TAX_FREE_AMOUNT_NOT_GRANTED: 'nie przysługuje',
+        TracedTaxPeriod.TAX_OWED_NOT_CLAMPED: 'bez zmian',
+        TracedTaxPeriod.TAX_OWED_CLAMPED: 'ujemna, przyjęto 0'
+    }
+
+    DIFF_LABELS = dict(zip(INPUT_NAMES + OUTPUT_NAMES, INPUT_LABELS + OUTPUT_LABELS))
+
+    SCENARIOS_HEADER = 'Scenariusze'
+    SCENARIO_SAVE_TEXT = 'Zapisz'
+    SCENARIO_RESTORE_TEXT = 'Przywróć'
+    SCENARIO_REMOVE_TEXT = 'Usuń'
+    SCENARIO_DIFF_TEXT = 'Porównaj z'
+    SCENARIO_NO_DIFFERENCES_TEXT = 'Brak różnic'
+    SCENARIO_SKIPPED_TEXT = 'Pominięto nieprawidłowo zapisane scenariusze: '
+
+    TRACE_CHECKBOX_TEXT = 'Pokaż wyliczenia krok po kroku'
+    TRACE_EXPORT_TEXT = 'Eksportuj wyliczenia do JSON'
+    TRACE_EXPORT_ERROR_TEXT = 'Nie udało się zapisać wyliczeń do pliku '
+    TRACE_VALUE_NAMES = ['income', 'tax_basis', 'tax', 'tax_free_amount', 'tax_owed']
+
     MAIN_TAB_TEXT = 'ZALICZKA'
     OPTIONS_TAB_TEXT = 'OPCJE'
 
@@ -168,12 +198,24 @@ class KalkulatorGUI:
     _inputs: 'Dict[str,FormField]'
     _outputs: 'Dict[str,OutputFormField]'
     _tax_period: 'TaxPeriod'
+    _graph: 'DependencyGraph'
+    _scenarios: 'Scenarios'
+    _suppress_updates: 'bool'
     _options: 'GUIOptions'
     _inputs_frame: 'ttk.LabelFrame'
     _outputs_frame: 'ttk.LabelFrame'
     _notebook: 'ttk.Notebook'
     _main_tab: 'tk.Frame'
     _options_tab: 'tk.Frame'
+    _trace_enabled: 'tk.BooleanVar'
+    _trace_checkbox: 'tk.Checkbutton'
+    _trace_export_button: 'tk.Button'
+    _trace_label: 'tk.Label'
+    _scenarios_frame: 'ttk.LabelFrame'
+    _scenario_name: 'ttk.Combobox'
+    _scenario_compared: 'ttk.Combobox'
+    _scenario_buttons: 'List[tk.Button]'
+    _scenario_diff_label: 'tk.Label'
 
     def __init__(self):
         def create_inputs(parent):
@@ -195,6 +237,7 @@ class KalkulatorGUI:
         def create_frames(parent):
             self._inputs_frame = ttk.Labelframe(parent, text=KalkulatorGUI.INPUTS_HEADER)
             self._outputs_frame = ttk.Labelframe(parent, text=KalkulatorGUI.OUTPUTS_HEADER)
+            self._scenarios_frame = ttk.Labelframe(parent, text=KalkulatorGUI.SCENARIOS_HEADER)
 
         def create_notebook(parent):
             self._notebook = ttk.Notebook(parent)
@@ -203,10 +246,38 @@ class KalkulatorGUI:
             self._main_tab = tk.Frame(parent)
             self._options_tab = tk.Frame(parent)
 
+        def create_scenario_widgets(parent):
+            self._scenario_name = ttk.Combobox(parent, font=self._options.default_font())
+            self._scenario_compared = ttk.Combobox(parent, state='readonly', font=self._options.default_font())
+            self._scenario_buttons = []
+            for button_text, command in [
+                (KalkulatorGUI.SCENARIO_SAVE_TEXT, self._save_scenario),
+                (KalkulatorGUI.SCENARIO_RESTORE_TEXT, self._restore_scenario),
+                (KalkulatorGUI.SCENARIO_REMOVE_TEXT, self._remove_scenario),
+                (KalkulatorGUI.SCENARIO_DIFF_TEXT, self._diff_scenarios)
+            ]:
+                self._scenario_buttons.append(tk.Button(
+                    parent, text=button_text, command=command, font=self._options.default_font()))
+            self._scenario_diff_label = tk.Label(
+                parent, justify='left', anchor='w', font=self._options.default_font())
+
+        def create_trace_widgets():
+            self._trace_enabled = tk.BooleanVar(value=False)
+            self._trace_checkbox = tk.Checkbutton(
+                self._options_tab, text=KalkulatorGUI.TRACE_CHECKBOX_TEXT,
+                variable=self._trace_enabled, font=self._options.default_font())
+            self._trace_export_button = tk.Button(
+                self._options_tab, text=KalkulatorGUI.TRACE_EXPORT_TEXT,
+                font=self._options.default_font())
+            self._trace_label = tk.Label(
+                self._outputs_frame, justify='left', anchor='w', font=self._options.default_font())
+
         self._root = tk.Tk()
         self._inputs = {}
         self._outputs = {}
         self._tax_period = TaxPeriod()
+        self._scenarios = Scenarios()
+        self._suppress_updates = False
         self._options = GUIOptions()
 
         create_notebook(parent=self._root)
@@ -214,11 +285,15 @@ class KalkulatorGUI:
         create_frames(parent=self._main_tab)
         create_inputs(parent=self._inputs_frame)
         create_outputs(parent=self._outputs_frame)
+        create_scenario_widgets(parent=self._scenarios_frame)
+        create_trace_widgets()
+        self._create_graph()
 
     def _arrange_form(self):
         self._main_tab.columnconfigure(0, weight=1)
         self._main_tab.rowconfigure(0, weight=1)
         self._main_tab.rowconfigure(1, weight=1)
+        self._main_tab.rowconfigure(2, weight=1)
 
         self._notebook.pack(fill='both', expand=1)
         self._main_tab.pack(fill='both', expand=1)
@@ -241,50 +316,128 @@ class KalkulatorGUI:
             output_field.grid(current_row)
             output_field.set_text("read only " + str(current_row))
             current_row += 1
+        self._trace_label.grid(column=0, row=current_row, columnspan=2, sticky='we')
+        self._trace_label.grid_remove()
+
+        self._scenarios_frame.grid(column=0, row=2, sticky='new')
+        self._scenarios_frame.columnconfigure(0, weight=1)
+        self._scenario_name.grid(column=0, row=0, sticky='we')
+        self._scenario_compared.grid(column=0, row=1, sticky='we')
+        for column, button in enumerate(self._scenario_buttons[:3], start=1):
+            button.grid(column=column, row=0, sticky='we')
+        self._scenario_buttons[3].grid(column=1, row=1, columnspan=3, sticky='we')
+        self._scenario_diff_label.grid(column=0, row=2, columnspan=4, sticky='we')
+
+        self._trace_checkbox.grid(column=0, row=0, sticky='w')
+        self._trace_export_button.grid(column=0, row=1, sticky='w')
 
     def _assign_callbacks(self):
         for input_field in self._all_inputs():
             input_field.attach_write_callback(self._update_callback)
+        self._trace_enabled.trace('w', self._trace_toggled_callback)
+        self._trace_export_button.config(command=self._export_trace)
         self._root.protocol("WM_DELETE_WINDOW", self._on_closing)
 
     def _update_callback(self, *_):
+        if self._suppress_updates:
+            return
         self._update_tax_period_from_inputs()
         self._update_outputs()
+        if self._trace_enabled.get():
+            self._update_trace()
 
-    def _update_outputs(self):
-        self._outputs['income'].set_text(
-            str(self._tax_period.income())
-        )
-        self._outputs['tax_basis'].set_text(
-            str(self._tax_period.tax_basis())
-        )
-        self._outputs['tax'].set_text(
-            str(self._tax_period.tax())
-        )
-        self._outputs['tax_owed'].set_text(
-            str(self._tax_period.tax_owed())
-        )
-
-    def _update_tax_period_from_inputs(self):
-        self._tax_period.set_revenue(
-            self._read_input('revenue')
-        )
+    def _create_graph(self):
+        self._graph = tax_period_graph(self._tax_period)
+        for output_name in KalkulatorGUI.OUTPUT_NAMES:
+            self._graph.watch(
+                output_name,
+                lambda value, field=self._outputs[output_name]: field.set_text(str(value)))
+
+    def _trace_toggled_callback(self, *_):
+        if self._trace_enabled.get():
+            self._tax_period = TracedTaxPeriod()
+            self._trace_label.grid()
+        else:
+            self._tax_period = TaxPeriod()
+            self._trace_label.grid_remove()
+        self._create_graph()
+        self._update_callback()
 
-        self._tax_period.set_expenses(
-            self._read_input('expenses')
-        )
+    def _update_trace(self):
+        values = {}
+        for value_name in KalkulatorGUI.TRACE_VALUE_NAMES:
+            values[value_name] = self._graph.value(value_name)
+        lines = []
+        for step, value in self._tax_period.trace_for(values):
+            value_text = KalkulatorGUI.TRACE_BRANCH_LABELS.get(value, str(value))
+            lines.append(KalkulatorGUI.TRACE_LABELS[step] + ': ' + value_text)
+        self._trace_label.config(text='\n'.join(lines))
+
+    def _export_trace(self):
+        traced_period = TracedTaxPeriod()
+        traced_period.restore(self._tax_period.snapshot())
+        traced_period.tax_owed()
+        try:
+            save_trace(traced_period.trace_to_json())
+        except OSError as error:
+            messagebox.showerror(
+                KalkulatorGUI.TRACE_EXPORT_TEXT,
+                KalkulatorGUI.TRACE_EXPORT_ERROR_TEXT + TRACE_FILENAME + '\n' + str(error))
+
+    def _save_scenario(self):
+        name = self._scenario_name.get()
+        if not name:
+            return
+        self._scenarios.save(name, self._tax_period.snapshot())
+        self._update_scenario_names()
+
+    def _restore_scenario(self):
+        name = self._scenario_name.get()
+        if name not in self._scenarios.names():
+            return
+        inputs = self._scenarios.get(name)
+        self._suppress_updates = True
+        try:
+            for input_name, value in inputs._asdict().items():
+                self._inputs[input_name].set_text(str(value))
+        finally:
+            self._suppress_updates = False
+        self._update_callback()
 
-        self._tax_period.set_tax_reduction(
-            self._read_input('tax_reduction')
-        )
+    def _remove_scenario(self):
+        name = self._scenario_name.get()
+        if name not in self._scenarios.names():
+            return
+        self._scenarios.remove(name)
+        self._scenario_name.set('')
+        self._update_scenario_names()
+
+    def _diff_scenarios(self):
+        first_name = self._scenario_name.get()
+        second_name = self._scenario_compared.get()
+        scenario_names = self._scenarios.names()
+        if first_name not in scenario_names or second_name not in scenario_names:
+            return
+        lines = []
+        for name, (first_value, second_value) in self._scenarios.diff(
+                first_name, second_name, KalkulatorGUI.OUTPUT_NAMES).items():
+            lines.append('{}: {} → {} ({:+})'.format(
+                KalkulatorGUI.DIFF_LABELS[name], first_value, second_value, second_value - first_value))
+        if not lines:
+            lines.append(KalkulatorGUI.SCENARIO_NO_DIFFERENCES_TEXT)
+        self._scenario_diff_label.config(text='\n'.join(lines))
+
+    def _update_scenario_names(self):
+        scenario_names = self._scenarios.names()
+        self._scenario_name.config(values=scenario_names)
+        self._scenario_compared.config(values=scenario_names)
 
-        self._tax_period.set_income_reduction(
-            self._read_input('income_reduction')
-        )
+    def _update_outputs(self):
+        self._graph.update()
 
-        self._tax_period.set_tax_prepayment(
-            self._read_input('tax_prepayment')
-        )
+    def _update_tax_period_from_inputs(self):
+        for input_name in KalkulatorGUI.INPUT_NAMES:
+            self._graph.set_input(input_name, self._read_input(input_name))
 
     def _read_input(self, input_name: 'str') -> 'dec.Decimal':
         try:
@@ -311,17 +464,24 @@ class KalkulatorGUI:
 
     def _load_inputs(self):
         try:
-            inputs_dict = load_inputs()
-            for input_name, value in inputs_dict.items():
+            inputs_dict, scenarios_dict = load_inputs_and_scenarios()
+        except (OSError, ValueError):
+            return
+        for input_name, value in inputs_dict.items():
+            if input_name in self._inputs:
                 self._inputs[input_name].set_text(value)
-        except json.decoder.JSONDecodeError:
-            pass
+        self._scenarios = Scenarios.from_dict(scenarios_dict)
+        self._update_scenario_names()
+        if self._scenarios.skipped_names:
+            messagebox.showwarning(
+                KalkulatorGUI.SCENARIOS_HEADER,
+                KalkulatorGUI.SCENARIO_SKIPPED_TEXT + ', '.join(self._scenarios.skipped_names))
 
     def _save_inputs(self):
         inputs_dict = {}
         for input_name, value in self._inputs.items():
             inputs_dict[input_name] = value.get_input()
-        save_inputs(inputs_dict)
+        save_inputs(inputs_dict, self._scenarios.to_dict())
 
     def _on_closing(self):
         # TODO error handling
@@ -0,0 +1,42 @@
+"""
+Author: Dominik Dąbek
+"""
+
+import decimal as dec
+import re
+
+
+def strip_non_numeric(input_str: 'str') -> 'str':
+    return re.match(r'^\D*(\d.*\d)\D*$', input_str).group(1)
+
+
+def only_numeric(input_str: 'str') -> 'str':
+    return re.sub(r'\D', '', input_str)
+
+
+def clean_input(input_str: 'str') -> 'str':
+    cleaned_input = strip_non_numeric(input_str)
+    separator_index = None
+    try:
+        if not cleaned_input[-2].isnumeric():
+            separator_index = -2
+        elif not cleaned_input[-3].isnumeric():
+            separator_index = -3
+    except IndexError:
+        pass
+    if separator_index:
+        whole_part = only_numeric(cleaned_input[:separator_index])
+        fraction_part = only_numeric(cleaned_input[separator_index + 1:])
+        cleaned_input = whole_part + '.' + fraction_part
+    else:
+        cleaned_input = only_numeric(cleaned_input)
+    return cleaned_input
+
+
+def convert_input(input_value: 'str') -> 'dec.Decimal':
+    try:
+        decimal = dec.Decimal(input_value.replace(',', '.'))
+    except (AttributeError, dec.InvalidOperation):
+        cleaned_input = clean_input(input_value)
+        decimal = dec.Decimal(cleaned_input)
+    return decimal
@@ -0,0 +1,85 @@
+"""
+Author: Dominik Dąbek
+"""
+
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Tuple
+from skala_podatkowa import TaxPeriod, TaxPeriodInputs
+
+# wyniki TaxPeriod porównywane w diff
+DIFF_QUANTITIES = [
+    'income',
+    'tax_basis',
+    'tax',
+    'tax_free_amount',
+    'tax_owed',
+    'tax_owed_end_of_year'
+]
+
+
+class Scenarios:
+    """Named snapshots of TaxPeriod inputs, e.g. "current", "with the new laptop"."""
+
+    def __init__(self):
+        self._scenarios = {}  # type: Dict[str, TaxPeriodInputs]
+        self.skipped_names = []  # type: List[str]
+
+    def save(self, name: 'str', inputs: 'TaxPeriodInputs'):
+        self._scenarios[name] = inputs
+
+    def get(self, name: 'str') -> 'TaxPeriodInputs':
+        return self._scenarios[name]
+
+    def remove(self, name: 'str'):
+        del self._scenarios[name]
+
+    def names(self) -> 'List[str]':
+        return list(self._scenarios)
+
+    def diff(self, first_name: 'str', second_name: 'str',
+             quantities: 'List[str]' = None) -> 'Dict[str,Tuple[Decimal,Decimal]]':
+        """Returns (first, second) values of the inputs and quantities that differ between two scenarios."""
+        if quantities is None:
+            quantities = DIFF_QUANTITIES
+        first_inputs = self._scenarios[first_name]
+        second_inputs = self._scenarios[second_name]
+        differences = {}
+        for input_name, first_value, second_value in zip(TaxPeriodInputs._fields, first_inputs, second_inputs):
+            if first_value != second_value:
+                differences[input_name] = (first_value, second_value)
+        first_period = TaxPeriod()
+        first_period.restore(first_inputs)
+        second_period = TaxPeriod()
+        second_period.restore(second_inputs)
+        for quantity in quantities:
+            first_value = getattr(first_period, quantity)()
+            second_value = getattr(second_period, quantity)()
+            if first_value != second_value:
+                differences[quantity] = (first_value, second_value)
+        return differences
+
+    def to_dict(self) -> 'Dict[str,Dict[str,str]]':
+        scenarios_dict = {}
+        for name, inputs in self._scenarios.items():
+            scenarios_dict[name] = {input_name: str(value) for input_name, value in inputs._asdict().items()}
+        return scenarios_dict
+
+    @staticmethod
+    def from_dict(scenarios_dict: 'Dict[str,Dict[str,str]]') -> 'Scenarios':
+        """Scenarios with unknown inputs or values that are not numbers are skipped
+        and their names are kept in skipped_names."""
+        scenarios = Scenarios()
+        if not isinstance(scenarios_dict, dict):
+            return scenarios
+        for name, inputs_dict in scenarios_dict.items():
+            try:
+                inputs = TaxPeriodInputs(**{
+                    input_name: Decimal(value) for input_name, value in inputs_dict.items()})
+            except (AttributeError, TypeError, ValueError, InvalidOperation):
+                scenarios.skipped_names.append(name)
+                continue
+            if not all(value.is_finite() for value in inputs):
+                scenarios.skipped_names.append(name)
+                continue
+            scenarios.save(name, inputs)
+        return scenarios
@@ -2,7 +2,9 @@
 Author: Dominik Dąbek
 """
 
+import json
 from decimal import *
+from typing import Dict, List, NamedTuple, Tuple
 
 
 def list_to_decimal(list_of_str: 'List[str]') -> 'List[Decimal]':
@@ -20,6 +22,15 @@ def round_whole(dec: 'Decimal') -> 'Decimal':
     return dec.quantize(Decimal('1'))
 
 
+class TaxPeriodInputs(NamedTuple):
+    """Immutable copy of TaxPeriod inputs; Decimals are immutable too, so copies share them."""
+    revenue: 'Decimal' = Decimal('0')
+    expenses: 'Decimal' = Decimal('0')
+    tax_reduction: 'Decimal' = Decimal('0')
+    income_reduction: 'Decimal' = Decimal('0')
+    tax_prepayment: 'Decimal' = Decimal('0')
+
+
 class TaxPeriod:
     """Calculates tax owed
     https://ksiegowosc.infor.pl/podatki/pit/pit/rozliczenia/3063125,2,PIT-2020-skala-podatkowa-stawki-i-koszty-uzyskania-przychodu.html"""
@@ -52,6 +63,17 @@ class TaxPeriod:
     def set_tax_prepayment(self, value_to_set: 'Decimal'):
         self.tax_prepayment = value_to_set
 
+    def snapshot(self) -> 'TaxPeriodInputs':
+        return TaxPeriodInputs(self.revenue, self.expenses, self.tax_reduction,
+                               self.income_reduction, self.tax_prepayment)
+
+    def restore(self, inputs: 'TaxPeriodInputs'):
+        self.set_revenue(inputs.revenue)
+        self.set_expenses(inputs.expenses)
+        self.set_tax_reduction(inputs.tax_reduction)
+        self.set_income_reduction(inputs.income_reduction)
+        self.set_tax_prepayment(inputs.tax_prepayment)
+
     def income(self) -> 'Decimal':
         return self.revenue - self.expenses
 
@@ -119,3 +141,66 @@ class TaxPeriod:
     def tax_owed_end_of_year_rounded(self) -> 'Decimal':
         return round_whole(self.tax_owed_end_of_year())
         pass
+
+
+class TracedTaxPeriod(TaxPeriod):
+    """TaxPeriod that records every intermediate value of tax_owed() in self.trace.
+    Plain TaxPeriod records nothing, so tracing costs only when this class is used."""
+    TAX_BELOW_THRESHOLD = 'below_threshold'
+    TAX_ABOVE_THRESHOLD = 'above_threshold'
+    TAX_FREE_AMOUNT_GRANTED = 'tax_free_amount_granted'
+    TAX_FREE_AMOUNT_NOT_GRANTED = 'tax_free_amount_not_granted'
+    TAX_OWED_NOT_CLAMPED = 'tax_owed_not_clamped'
+    TAX_OWED_CLAMPED = 'tax_owed_clamped_to_zero'
+
+    def __init__(self):
+        super().__init__()
+        self.trace = []  # lista par (krok, wartość)
+
+    def tax_owed(self) -> 'Decimal':
+        tax_owed = super().tax_owed()
+        self.trace = self.trace_for({
+            'income': self.income(),
+            'tax_basis': self.tax_basis(),
+            'tax': self.tax(),
+            'tax_free_amount': self.tax_free_amount(),
+            'tax_owed': tax_owed
+        })
+        return tax_owed
+
+    def trace_for(self, values: 'Dict[str,Decimal]') -> 'List[Tuple[str,object]]':
+        """Builds the trace from already calculated income, tax_basis, tax, tax_free_amount and tax_owed.
+        Branches are decided with the same comparisons as in TaxPeriod."""
+        tax_basis = round_whole(values['tax_basis'])
+        if self.THRESHOLD >= tax_basis:
+            tax_bracket = self.TAX_BELOW_THRESHOLD
+        else:
+            tax_bracket = self.TAX_ABOVE_THRESHOLD
+        if self.TAX_FREE_AMOUNT_THRESHOLDS[2] >= tax_basis:
+            tax_free_amount_bracket = self.TAX_FREE_AMOUNT_GRANTED
+        else:
+            tax_free_amount_bracket = self.TAX_FREE_AMOUNT_NOT_GRANTED
+        tax_owed = values['tax'] - self.tax_reduction - values['tax_free_amount'] - self.tax_prepayment
+        if 0 > tax_owed:
+            tax_owed_branch = self.TAX_OWED_CLAMPED
+        else:
+            tax_owed_branch = self.TAX_OWED_NOT_CLAMPED
+        return [
+            ('revenue', self.revenue),
+            ('expenses', self.expenses),
+            ('income', values['income']),
+            ('income_reduction', self.income_reduction),
+            ('tax_basis', values['tax_basis']),
+            ('tax_basis_rounded', tax_basis),
+            ('tax_bracket', tax_bracket),
+            ('tax', values['tax']),
+            ('tax_reduction', self.tax_reduction),
+            ('tax_free_amount_bracket', tax_free_amount_bracket),
+            ('tax_free_amount', values['tax_free_amount']),
+            ('tax_prepayment', self.tax_prepayment),
+            ('tax_owed_branch', tax_owed_branch),
+            ('tax_owed', values['tax_owed'])
+        ]
+
+    def trace_to_json(self) -> 'str':
+        return json.dumps([{'step': step, 'value': str(value)} for step, value in self.trace])
@@ -2,17 +2,29 @@
 Author: Dominik Dąbek
 """
 
+import datetime
+import json
+import os
+import tempfile
 import unittest
 from typing import List, Tuple
 
 import skala_podatkowa
+from graf_zaleznosci import DependencyGraph, tax_period_graph, TAX_PERIOD_DEPENDENCIES
+from import_danych import parse_amount, classify_amount, read_bank_csv, read_kpir_csv, aggregate_monthly, cumulative_tax_periods
 from decimal import *
-from kalkulator_GUI import convert_input, strip_non_numeric, only_numeric, clean_input, save_inputs, load_inputs
+from kalkulator_GUI import save_inputs, load_inputs, load_inputs_and_scenarios
+from parsowanie import convert_input, strip_non_numeric, only_numeric, clean_input
+from scenariusze import Scenarios
+from tablica_podatku import build_table, check_table, TaxTable
 
 
 class BaseTestCase(unittest.TestCase):
     def setUp(self) -> None:
-        self.tax_payer = skala_podatkowa.TaxPeriod()
+        self.tax_payer = self._create_tax_payer()
+
+    def _create_tax_payer(self) -> 'skala_podatkowa.TaxPeriod':
+        return skala_podatkowa.TaxPeriod()
 
     def _test_tax_basis(self, expected):
         self.assertEqual(Decimal(expected), self.tax_payer.tax_basis(),
@@ -193,6 +205,225 @@ class Test150k(BaseTestCase):
         self._test_tax_owed_end_of_year_rounded('30423')
 
 
+def scenario_tax_payers() -> 'List[skala_podatkowa.TaxPeriod]':
+    tax_payers = []
+    for scenario in [InitialData, TestCase1, TestCase2, Test100k, Test150k]:
+        test_case = scenario()
+        test_case.setUp()
+        tax_payers.append(test_case.tax_payer)
+    return tax_payers
+
+
+class TracedTestMixin:
+    def _create_tax_payer(self) -> 'skala_podatkowa.TaxPeriod':
+        return skala_podatkowa.TracedTaxPeriod()
+
+    def _traced_branches(self):
+        self.tax_payer.tax_owed()
+        trace = dict(self.tax_payer.trace)
+        return trace['tax_bracket'], trace['tax_free_amount_bracket'], trace['tax_owed_branch']
+
+    def test_trace(self):
+        tax_owed = self.tax_payer.tax_owed()
+        trace = dict(self.tax_payer.trace)
+        self.assertEqual(self.tax_payer.income(), trace['income'])
+        self.assertEqual(self.tax_payer.tax_basis(), trace['tax_basis'])
+        self.assertEqual(self.tax_payer.tax(), trace['tax'])
+        self.assertEqual(self.tax_payer.tax_free_amount(), trace['tax_free_amount'])
+        self.assertEqual(tax_owed, trace['tax_owed'])
+        self.assertEqual('tax_owed', self.tax_payer.trace[-1][0])
+
+    def test_trace_to_json(self):
+        tax_owed = self.tax_payer.tax_owed()
+        exported = json.loads(self.tax_payer.trace_to_json())
+        self.assertEqual({'step': 'tax_owed', 'value': str(tax_owed)}, exported[-1])
+
+
+class TracedInitialData(TracedTestMixin, InitialData):
+    def test_trace_branches(self):
+        self.assertEqual((skala_podatkowa.TracedTaxPeriod.TAX_BELOW_THRESHOLD,
+                          skala_podatkowa.TracedTaxPeriod.TAX_FREE_AMOUNT_GRANTED,
+                          skala_podatkowa.TracedTaxPeriod.TAX_OWED_CLAMPED),
+                         self._traced_branches())
+
+
+class TracedTestCase1(TracedTestMixin, TestCase1):
+    def test_trace_branches(self):
+        self.assertEqual((skala_podatkowa.TracedTaxPeriod.TAX_BELOW_THRESHOLD,
+                          skala_podatkowa.TracedTaxPeriod.TAX_FREE_AMOUNT_GRANTED,
+                          skala_podatkowa.TracedTaxPeriod.TAX_OWED_NOT_CLAMPED),
+                         self._traced_branches())
+
+
+class TracedTestCase2(TracedTestMixin, TestCase2):
+    pass
+
+
+class TracedTest100k(TracedTestMixin, Test100k):
+    def test_trace_branches(self):
+        self.assertEqual((skala_podatkowa.TracedTaxPeriod.TAX_ABOVE_THRESHOLD,
+                          skala_podatkowa.TracedTaxPeriod.TAX_FREE_AMOUNT_NOT_GRANTED,
+                          skala_podatkowa.TracedTaxPeriod.TAX_OWED_NOT_CLAMPED),
+                         self._traced_branches())
+
+
+class TracedTest150k(TracedTestMixin, Test150k):
+    pass
+
+
+class TracedBranchesTestCase(unittest.TestCase):
+    BASES = ['0', '85527', '85528', '85528.49', '85528.5', '85529', '127000', '200000', '-500']
+
+    def _tax_payers(self) -> 'List[skala_podatkowa.TaxPeriod]':
+        tax_payers = scenario_tax_payers()
+        for basis in self.BASES:
+            tax_payer = skala_podatkowa.TaxPeriod()
+            tax_payer.revenue = Decimal(basis)
+            tax_payer.tax_prepayment = Decimal('500')
+            tax_payers.append(tax_payer)
+        return tax_payers
+
+    def test_branches_match_tax_period(self):
+        for tax_payer in self._tax_payers():
+            traced = skala_podatkowa.TracedTaxPeriod()
+            traced.restore(tax_payer.snapshot())
+            traced.tax_owed()
+            trace = dict(traced.trace)
+            tax_basis = skala_podatkowa.round_whole(tax_payer.tax_basis())
+            below_threshold = tax_payer.tax() == \
+                skala_podatkowa.round_cents(tax_basis * skala_podatkowa.TaxPeriod.BEFORE_THRESHOLD_TAX)
+            unclamped = tax_payer.tax() - tax_payer.tax_reduction - tax_payer.tax_free_amount() - \
+                tax_payer.tax_prepayment
+            self.assertEqual(below_threshold,
+                             trace['tax_bracket'] == skala_podatkowa.TracedTaxPeriod.TAX_BELOW_THRESHOLD,
+                             msg=tax_basis)
+            granted = trace['tax_free_amount_bracket'] == skala_podatkowa.TracedTaxPeriod.TAX_FREE_AMOUNT_GRANTED
+            self.assertEqual(tax_payer.tax_free_amount() != 0, granted, msg=tax_basis)
+            self.assertEqual(tax_payer.tax_owed() != unclamped,
+                             trace['tax_owed_branch'] == skala_podatkowa.TracedTaxPeriod.TAX_OWED_CLAMPED,
+                             msg=tax_basis)
+
+
+class DependencyGraphTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.computed = []
+        self.notified = []
+        self.graph = DependencyGraph()
+        self.graph.add_input('a', 1)
+        self.graph.add_input('b', 2)
+        self.graph.add_derived('sum', self._compute('sum', lambda a, b: a + b), ['a', 'b'])
+        self.graph.add_derived('double_a', self._compute('double_a', lambda a: a * 2), ['a'])
+        self.graph.add_derived('sign', self._compute('sign', lambda total: total >= 0), ['sum'])
+        self.graph.watch('sign', self.notified.append)
+        self.graph.update()
+
+    def _compute(self, name, function):
+        def compute(*values):
+            self.computed.append(name)
+            return function(*values)
+        return compute
+
+    def test_initial_update(self):
+        self.assertCountEqual(['sum', 'double_a', 'sign'], self.computed)
+        self.assertEqual(3, self.graph.value('sum'))
+        self.assertEqual([True], self.notified)
+
+    def test_only_dependents_recomputed(self):
+        self.computed.clear()
+        self.graph.set_input('b', 5)
+        self.graph.update()
+        self.assertEqual(['sum', 'sign'], self.computed)
+
+    def test_unchanged_input(self):
+        self.computed.clear()
+        self.graph.set_input('a', 1)
+        self.graph.update()
+        self.assertEqual([], self.computed)
+
+    def test_unchanged_value_stops_propagation(self):
+        self.computed.clear()
+        self.graph.set_input('a', 2)
+        self.graph.set_input('b', 1)
+        self.graph.update()
+        self.assertCountEqual(['sum', 'double_a'], self.computed)
+        self.assertEqual([True], self.notified)
+
+    def test_missing_dependency(self):
+        with self.assertRaises(KeyError):
+            self.graph.add_derived('product', lambda a, c: a * c, ['a', 'c'])
+
+    def test_tax_period_graph(self):
+        for tax_payer in scenario_tax_payers():
+            graph = tax_period_graph(skala_podatkowa.TaxPeriod())
+            for input_name, value in tax_payer.snapshot()._asdict().items():
+                graph.set_input(input_name, value)
+            graph.update()
+            self.assertEqual(skala_podatkowa.round_whole(tax_payer.tax_basis()), graph.value('tax_basis_rounded'))
+            for quantity in TAX_PERIOD_DEPENDENCIES:
+                if quantity != 'tax_basis_rounded':
+                    self.assertEqual(getattr(tax_payer, quantity)(), graph.value(quantity), msg=quantity)
+
+    def test_tax_period_graph_keystroke(self):
+        calls = []
+
+        class CountingTaxPeriod(skala_podatkowa.TaxPeriod):
+            def tax(self):
+                calls.append('tax')
+                return super().tax()
+
+            def tax_free_amount(self):
+                calls.append('tax_free_amount')
+                return super().tax_free_amount()
+
+        graph = tax_period_graph(CountingTaxPeriod())
+        graph.set_input('revenue', Decimal('26433'))
+        graph.update()
+        calls.clear()
+        graph.set_input('revenue', Decimal('26433.2'))
+        graph.update()
+        self.assertEqual([], calls)
+        graph.set_input('revenue', Decimal('27000'))
+        graph.update()
+        self.assertEqual(['tax', 'tax_free_amount'], calls)
+
+
+class TaxTableTestCase(unittest.TestCase):
+    MAX_BASIS = 140000  # obejmuje podstawy ze wszystkich przypadków testowych
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        file_descriptor, cls.file_name = tempfile.mkstemp(suffix='.bin')
+        os.close(file_descriptor)
+        build_table(cls.MAX_BASIS, cls.file_name)
+        cls.table = TaxTable(cls.file_name)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.table.close()
+        os.remove(cls.file_name)
+
+    def test_consistent_with_tax_period(self):
+        self.assertEqual(self.MAX_BASIS, self.table.max_basis)
+        self.assertEqual([], check_table(self.table, step=7))
+
+    def test_scenario_bases(self):
+        bases = [int(skala_podatkowa.round_whole(tax_payer.tax_basis())) for tax_payer in scenario_tax_payers()]
+        bases += [8000, 13000, 85528, 127000, 200000, -500]
+        tax_payer = skala_podatkowa.TaxPeriod()
+        taxes = []
+        tax_free_amounts = []
+        for basis in bases:
+            tax_payer.revenue = Decimal(basis)
+            taxes.append(int(tax_payer.tax() * 100))
+            tax_free_amounts.append(int(tax_payer.tax_free_amount_end_of_year() * 100))
+        self.assertEqual(taxes, list(self.table.tax_cents(bases)))
+        self.assertEqual(tax_free_amounts, list(self.table.tax_free_amount_end_of_year_cents(bases)))
+
+    def test_outside_table(self):
+        self.assertEqual([5117080, -8500], list(self.table.tax_cents([200000, -500])))
+        self.assertEqual([0, 136000], list(self.table.tax_free_amount_end_of_year_cents([200000, -500])))
+
+
 class InputHandlingTestCase(unittest.TestCase):
     def _test_convert_input(self, inputs_expected: 'List[Tuple[str,str]]'):
         for input_value, expected in inputs_expected:
@@ -266,6 +497,174 @@ class InputHandlingTestCase(unittest.TestCase):
         self._test_convert_input(inputs_expected)
 
 
+class ImportTestCase(unittest.TestCase):
+    BANK_CSV = (
+        '#Klient;\n'
+        'JAN KOWALSKI;\n'
+        '\n'
+        '#Data operacji;#Opis operacji;#Kwota;#Saldo po operacji;\n'
+        '2020-01-05;PRZELEW PRZYCHODZĄCY;1 500,00;1 500,00;\n'
+        '2020-01-20;ZAKUP LAPTOPA;-3 200,50;-1 700,50;\n'
+        '2020-02-03;PRZELEW PRZYCHODZĄCY;2000,10;299,60;\n'
+        '2020-02-10;ZUS SKŁADKI 01/2020;-1 431,48;-1 131,88;\n'
+        '2020-02-18;/TI/N1234567890/OKR/20M01/SFP/PIT5L/;-300,00;-1 431,88;\n'
+        ';;;;\n'
+    )
+
+    KPIR_CSV = (
+        'Lp.;Data;Nr dowodu;Kontrahent;Adres;Opis;7;8;9;10;11;12;13;14;15;16;17\n'
+        '1;05.01.2020;FV 1/2020;Firma;Adres;Usługa;1000,00;;1000,00;;;;;;;;\n'
+        '2;10.01.2020;FV 123;Sklep;Adres;Zakup towaru;;;;200,00;10,00;;;;;;\n'
+        '3;15.02.2020;FV 55;Operator;Adres;Telefon;;;;;;;50,00;50,00;;;\n'
+        ';;;;;Razem;1000,00;;1000,00;200,00;10,00;;50,00;50,00;;;\n'
+    )
+
+    def _write_file(self, content):
+        file_descriptor, file_name = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+            file.write(content)
+        self.addCleanup(os.remove, file_name)
+        return file_name
+
+    def test_parse_amount(self):
+        inputs_expected = [
+            ('1 500,00', '1500.00'),
+            ('-3 200,50', '-3200.50'),
+            ('-12.343.222,50 PLN', '-12343222.50'),
+            ('9 PLN', '9'),
+            ('-5 zł', '-5'),
+            ('PLN -100,00', '-100.00'),
+            ('(100,00)', '-100.00'),
+            ('100,00-', '-100.00'),
+            ('−7,5', '-7.5'),
+            ('', '0')
+        ]
+        for input_value, expected in inputs_expected:
+            self.assertEqual(Decimal(expected), parse_amount(input_value), msg=input_value)
+
+    def test_parse_amount_invalid(self):
+        for input_value in ['PLN', '-', 'brak', 'NaN']:
+            with self.assertRaises(ValueError, msg=input_value):
+                parse_amount(input_value)
+
+    def test_bank_csv_single_digit_amounts(self):
+        transactions = list(read_bank_csv(self._write_file(
+            'Data operacji;Kwota\n'
+            '2020-01-05;9 PLN\n'
+            '2020-01-06;-5 zł\n'
+            '2020-01-07;PLN -100,00\n')))
+        self.assertEqual([Decimal('9'), Decimal('0'), Decimal('0')],
+                         [transaction.revenue for transaction in transactions])
+        self.assertEqual([Decimal('0'), Decimal('5'), Decimal('100.00')],
+                         [transaction.expenses for transaction in transactions])
+
+    def test_bank_csv_invalid_amount(self):
+        file_name = self._write_file(
+            'Data operacji;Kwota\n'
+            '2020-01-05;100,00\n'
+            '2020-01-06;brak\n')
+        with self.assertRaisesRegex(ValueError, 'wiersz 3'):
+            list(read_bank_csv(file_name))
+
+    def test_kpir_csv_invalid_amount(self):
+        file_name = self._write_file(self.KPIR_CSV + '4;20.02.2020;FV 56;Firma;Adres;Usługa;;;xx;;;;;;;;\n')
+        with self.assertRaisesRegex(ValueError, 'wiersz 6'):
+            list(read_kpir_csv(file_name))
+
+    def test_bank_csv_zus_and_tax_prepayment(self):
+        monthly_totals = aggregate_monthly(read_bank_csv(self._write_file(self.BANK_CSV)))
+        self.assertEqual(Decimal('0'), monthly_totals[(2020, 2)].expenses)
+        self.assertEqual(Decimal('1431.48'), monthly_totals[(2020, 2)].zus)
+        self.assertEqual(Decimal('300.00'), monthly_totals[(2020, 2)].tax_prepayment)
+        tax_periods = cumulative_tax_periods(monthly_totals)
+        self.assertEqual(Decimal('3200.50'), tax_periods[(2020, 2)].expenses)
+        self.assertEqual(Decimal('300.00'), tax_periods[(2020, 2)].tax_prepayment)
+
+    def test_inflows_are_revenue(self):
+        date = datetime.date(2020, 3, 2)
+        invoice = classify_amount(date, Decimal('1200'), 'Faktura 3/2020 rozliczenie PIT-37 Kowalski')
+        self.assertEqual((Decimal('1200'), Decimal('0'), Decimal('0'), Decimal('0')), invoice[1:])
+        sickness_benefit = classify_amount(date, Decimal('900'), 'ZUS ZASIŁEK CHOROBOWY')
+        self.assertEqual((Decimal('900'), Decimal('0'), Decimal('0'), Decimal('0')), sickness_benefit[1:])
+
+    def test_read_bank_csv(self):
+        transactions = list(read_bank_csv(self._write_file(self.BANK_CSV)))
+        self.assertEqual(5, len(transactions))
+        self.assertEqual(datetime.date(2020, 1, 20), transactions[1].date)
+        self.assertEqual(Decimal('0'), transactions[1].revenue)
+        self.assertEqual(Decimal('3200.50'), transactions[1].expenses)
+
+    def test_aggregate_bank_csv(self):
+        monthly_totals = aggregate_monthly(read_bank_csv(self._write_file(self.BANK_CSV)))
+        self.assertEqual([(2020, 1), (2020, 2)], list(monthly_totals))
+        self.assertEqual(Decimal('1500.00'), monthly_totals[(2020, 1)].revenue)
+        self.assertEqual(Decimal('3200.50'), monthly_totals[(2020, 1)].expenses)
+        self.assertEqual(Decimal('2000.10'), monthly_totals[(2020, 2)].revenue)
+
+    def test_kpir_cumulative(self):
+        monthly_totals = aggregate_monthly(read_kpir_csv(self._write_file(self.KPIR_CSV)))
+        self.assertEqual(Decimal('210.00'), monthly_totals[(2020, 1)].expenses)
+        tax_periods = cumulative_tax_periods(monthly_totals)
+        self.assertEqual(Decimal('1000.00'), tax_periods[(2020, 2)].revenue)
+        self.assertEqual(Decimal('260.00'), tax_periods[(2020, 2)].expenses)
+
+    def test_cumulative_resets_each_year(self):
+        monthly_totals = aggregate_monthly(read_bank_csv(self._write_file(
+            self.BANK_CSV + '2021-01-02;PRZELEW;100,00;;\n')))
+        tax_periods = cumulative_tax_periods(monthly_totals)
+        self.assertEqual(Decimal('100.00'), tax_periods[(2021, 1)].revenue)
+
+
+class ScenariosTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tax_payer = skala_podatkowa.TaxPeriod()
+        self.tax_payer.revenue = Decimal('26433')
+        self.tax_payer.expenses = Decimal('16416.65')
+        self.tax_payer.tax_reduction = Decimal('624.04')
+        self.scenarios = Scenarios()
+        self.scenarios.save('current', self.tax_payer.snapshot())
+
+    def test_snapshot_is_a_copy(self):
+        self.tax_payer.expenses = Decimal('20000')
+        self.assertEqual(Decimal('16416.65'), self.scenarios.get('current').expenses)
+
+    def test_restore(self):
+        laptop = self.scenarios.get('current')._replace(expenses=Decimal('20000'))
+        self.scenarios.save('laptop', laptop)
+        self.tax_payer.restore(laptop)
+        self.assertEqual(Decimal('6433'), self.tax_payer.income())
+        self.tax_payer.restore(self.scenarios.get('current'))
+        self.assertEqual(Decimal('553.56'), self.tax_payer.tax_owed())
+
+    def test_diff(self):
+        self.scenarios.save('laptop', self.scenarios.get('current')._replace(expenses=Decimal('20000')))
+        differences = self.scenarios.diff('current', 'laptop')
+        self.assertEqual((Decimal('16416.65'), Decimal('20000')), differences['expenses'])
+        self.assertEqual((Decimal('553.56'), Decimal('0')), differences['tax_owed'])
+        self.assertNotIn('revenue', differences)
+        self.assertNotIn('tax_free_amount', differences)
+        self.assertNotIn('tax_basis_rounded', differences)
+
+    def test_no_diff(self):
+        self.scenarios.save('copy', self.tax_payer.snapshot())
+        self.assertDictEqual({}, self.scenarios.diff('current', 'copy'))
+
+    def test_to_from_dict(self):
+        restored = Scenarios.from_dict(self.scenarios.to_dict())
+        self.assertEqual(self.scenarios.get('current'), restored.get('current'))
+        self.assertEqual([], restored.skipped_names)
+
+    def test_from_dict_skips_invalid(self):
+        scenarios_dict = self.scenarios.to_dict()
+        scenarios_dict['bad_value'] = {'revenue': 'abc'}
+        scenarios_dict['unknown_input'] = {'salary': '100'}
+        scenarios_dict['not_a_number'] = {'revenue': 'NaN'}
+        scenarios_dict['not_a_dict'] = ['100']
+        restored = Scenarios.from_dict(scenarios_dict)
+        self.assertEqual(['current'], restored.names())
+        self.assertCountEqual(['bad_value', 'unknown_input', 'not_a_number', 'not_a_dict'], restored.skipped_names)
+
+
 class SavingLoadingTestCase(unittest.TestCase):
     def test_save_load(self):
         inputs_dict = {
@@ -279,6 +678,15 @@ class SavingLoadingTestCase(unittest.TestCase):
         loaded_dict = load_inputs()
         self.assertDictEqual(inputs_dict, loaded_dict, "Błąd zapisu danych")
 
+    def test_save_load_scenarios(self):
+        inputs_dict = {'revenue': '2000'}
+        scenarios_dict = {'laptop': {'revenue': '2000', 'expenses': '5000'}}
+        save_inputs(inputs_dict, scenarios_dict)
+        self.assertDictEqual(inputs_dict, load_inputs(), "Błąd zapisu danych")
+        loaded_inputs, loaded_scenarios = load_inputs_and_scenarios()
+        self.assertDictEqual(inputs_dict, loaded_inputs, "Błąd zapisu danych")
+        self.assertDictEqual(scenarios_dict, loaded_scenarios, "Błąd zapisu scenariuszy")
+
 
 if __name__ == '__main__':
     unittest.main()
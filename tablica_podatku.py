@@ -0,0 +1,135 @@
+"""
+Author: Dominik Dąbek
+"""
+
+import array
+import hashlib
+import mmap
+import os
+import sys
+from decimal import Decimal
+from typing import Callable, Iterable, List
+from skala_podatkowa import TaxPeriod
+
+DEFAULT_MAX_BASIS = 1000000
+TABLE_FILENAME = 'tablica_podatku_{}_{}.bin'
+VALUES_PER_BASIS = 2  # podatek, kwota zmniejszająca podatek na koniec roku (w groszach)
+
+
+def rule_set_id(tax_period_class: 'type' = TaxPeriod) -> 'str':
+    """Identifies the tax constants a table was built with, so a table is never used with other rules."""
+    rules = repr([
+        tax_period_class.BEFORE_THRESHOLD_TAX,
+        tax_period_class.THRESHOLD,
+        tax_period_class.AFTER_THRESHOLD_TAX,
+        tax_period_class.AFTER_THRESHOLD_CONSTANT,
+        tax_period_class.TAX_FREE_AMOUNT_THRESHOLDS,
+        tax_period_class.TAX_FREE_AMOUNT_CONSTANTS
+    ])
+    return hashlib.sha1(rules.encode()).hexdigest()[:8]
+
+
+def table_filename(max_basis: 'int' = DEFAULT_MAX_BASIS) -> 'str':
+    return TABLE_FILENAME.format(rule_set_id(), max_basis)
+
+
+def to_cents(value: 'Decimal') -> 'int':
+    return int(value.scaleb(2))
+
+
+def basis_calculation(method: 'Callable[[TaxPeriod], Decimal]') -> 'Callable[[Decimal], Decimal]':
+    """Calculates a TaxPeriod method for a tax basis, given as revenue without expenses or reductions."""
+    tax_period = TaxPeriod()
+
+    def calculate(basis: 'Decimal') -> 'Decimal':
+        tax_period.set_revenue(basis)
+        return method(tax_period)
+    return calculate
+
+
+def build_table(max_basis: 'int' = DEFAULT_MAX_BASIS, file_name: 'str' = None) -> 'str':
+    """Writes tax and end of year tax free amount for every whole złoty basis from 0 to max_basis."""
+    if file_name is None:
+        file_name = table_filename(max_basis)
+    tax = basis_calculation(TaxPeriod.tax)
+    tax_free_amount_end_of_year = basis_calculation(TaxPeriod.tax_free_amount_end_of_year)
+    values = array.array('q')
+    for basis in range(max_basis + 1):
+        values.append(to_cents(tax(Decimal(basis))))
+        values.append(to_cents(tax_free_amount_end_of_year(Decimal(basis))))
+    with open(file_name, 'wb') as file:
+        values.tofile(file)
+    return file_name
+
+
+class TaxTable:
+    """Memory-mapped table built by build_table(), looked up by whole złoty tax basis.
+    Values are stored in native byte order, so build the table on the machine that uses it.
+    Lookups take many integer bases at once and return grosze, which is where the table is faster than the formulas."""
+
+    def __init__(self, file_name: 'str'):
+        with open(file_name, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._values = memoryview(self._mmap).cast('q')
+        self.max_basis = len(self._values) // VALUES_PER_BASIS - 1
+
+    def close(self):
+        self._values.release()
+        self._mmap.close()
+
+    def tax_cents(self, bases: 'Iterable[int]') -> 'array.array':
+        """Tax in grosze for each whole złoty basis, bases outside of the table are calculated."""
+        return self._lookup_cents(bases, 0, basis_calculation(TaxPeriod.tax))
+
+    def tax_free_amount_end_of_year_cents(self, bases: 'Iterable[int]') -> 'array.array':
+        """End of year tax free amount in grosze for each whole złoty basis,
+        bases outside of the table are calculated."""
+        return self._lookup_cents(bases, 1, basis_calculation(TaxPeriod.tax_free_amount_end_of_year))
+
+    def _lookup_cents(self, bases: 'Iterable[int]', offset: 'int',
+                      calculate: 'Callable[[Decimal], Decimal]') -> 'array.array':
+        values = self._values
+        max_basis = self.max_basis
+        return array.array('q', [
+            values[basis * VALUES_PER_BASIS + offset] if 0 <= basis <= max_basis
+            else to_cents(calculate(Decimal(basis)))
+            for basis in bases])
+
+
+def check_table(table: 'TaxTable', step: 'int' = 1) -> 'List[int]':
+    """Returns bases for which the table differs from TaxPeriod, checking every step-th basis."""
+    tax = basis_calculation(TaxPeriod.tax)
+    tax_free_amount_end_of_year = basis_calculation(TaxPeriod.tax_free_amount_end_of_year)
+    bases = range(0, table.max_basis + 1, step)
+    mismatches = []
+    for basis, tax_cents, tax_free_amount_cents in zip(
+            bases, table.tax_cents(bases), table.tax_free_amount_end_of_year_cents(bases)):
+        if tax_cents != to_cents(tax(Decimal(basis))) or \
+                tax_free_amount_cents != to_cents(tax_free_amount_end_of_year(Decimal(basis))):
+            mismatches.append(basis)
+    return mismatches
+
+
+def main():
+    if len(sys.argv) not in (2, 3) or sys.argv[1] not in ('build', 'check'):
+        print('Użycie: python tablica_podatku.py build|check [maksymalna_podstawa]')
+        sys.exit(1)
+    max_basis = int(sys.argv[2]) if len(sys.argv) == 3 else DEFAULT_MAX_BASIS
+    file_name = table_filename(max_basis)
+    if sys.argv[1] == 'build':
+        print('Zapisano ' + build_table(max_basis, file_name))
+    else:
+        if not os.path.exists(file_name):
+            print('Brak tablicy ' + file_name + ' dla obecnych stawek, uruchom: python tablica_podatku.py build')
+            sys.exit(1)
+        table = TaxTable(file_name)
+        mismatches = check_table(table)
+        table.close()
+        if mismatches:
+            print('Niezgodne podstawy: ' + ', '.join(str(basis) for basis in mismatches[:20]))
+            sys.exit(1)
+        print('Tablica zgodna z TaxPeriod')
+
+
+if __name__ == '__main__':
+    main()